@@ -1,35 +1,244 @@
 import asyncio
 import logging
+import os
+import random
 import signal
+import ssl
 import time
 from asyncio import Task
-from collections import namedtuple
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
 
-import aiofiles
 import aiohttp
-from bs4 import BeautifulSoup
+from lxml import etree
+from pybloom_live import ScalableBloomFilter
+
+from ycrawler.crawler.fingerprint import page_fingerprint
+from ycrawler.crawler.rate_limiter import (
+    AdaptiveConcurrencyLimiter,
+    HostConcurrencyLimiter,
+    HostRateLimiter,
+)
 
 logger = logging.getLogger(__name__)
 
 
-NewsInfo = namedtuple('NewsInfo', ['id', 'url', 'related_urls'])
+@dataclass(slots=True)
+class NewsInfo:
+    """Fresh news with urls found in its comments"""
+    id: str
+    url: str
+    related_urls: set[str] = field(default_factory=set)
+
+
+@dataclass(slots=True)
+class DownloadedPage:
+    """Downloaded page waiting to be written to disk"""
+    url: str
+    save_path: Path
+    data: bytes
+    related: bool
+    fingerprint: bytes | None = None
+
+
+@dataclass(slots=True)
+class TickStats:
+    """Download stats of one check for fresh news"""
+    successful_news: int = 0
+    found_urls: int = 0
+    downloaded_urls: int = 0
+    skipped_urls: int = 0
+    in_progress_urls: int = 0
+
+
+# News row links to vote arrow first, title link comes after
+_NEWS_URL_XPATH = etree.XPath(
+    'td[@class="title"]/span[@class="titleline"]/a[1]/@href'
+)
+# Link is nested into `div.comment` child, same as `div.comment > * a`
+_IN_COMMENT_XPATH = etree.XPath(
+    'boolean(ancestor::*/parent::div['
+    'contains(concat(" ", normalize-space(@class), " "), " comment ")'
+    '])'
+)
+
+_TRACKING_PARAMS = frozenset(('fbclid', 'gclid', 'ref', 'ref_src'))
+
+
+def _is_overload(error: Exception) -> bool:
+    """Tells if request error means that server cannot cope with load
+
+    Only socket timeouts count: total timeout also covers waiting for
+    a free pooled connection, which says nothing about the server
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in (429, 503)
+    return isinstance(error, aiohttp.ServerTimeoutError)
+
+
+def _drop_parsed(element: etree._Element) -> None:
+    """Frees element and everything parsed before it
+
+    Only still open ancestors of element and their attributes are kept,
+    so the tree does not grow with the page
+    """
+    element.clear()
+    node = element
+    while (parent := node.getparent()) is not None:
+        while node.getprevious() is not None:
+            del parent[0]
+        node = parent
+
+
+def _parse_retry_after(value: str | None) -> float:
+    """Converts `Retry-After` header to seconds, 0 if it is absent or invalid
+
+    Header is either number of seconds or http date
+    """
+    if value is None:
+        return 0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _is_tracking_param(param: str) -> bool:
+    """Checks if raw query parameter is only used for click tracking"""
+    key = param.partition('=')[0]
+    return key in _TRACKING_PARAMS or key.startswith('utm_')
+
+
+def _normalize_url(url: str) -> str:
+    """Brings url to canonical form so its variants are deduplicated
+
+    Lower-cases scheme and host, drops fragment and tracking parameters,
+    sorts the rest of query parameters by key. Parameters are kept as they
+    are written in url, so the normalized url still points to the same page
+    """
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    userinfo, at, host = parts.netloc.rpartition('@')
+    query = '&'.join(sorted(
+        (
+            param for param in parts.query.split('&')
+            if param and not _is_tracking_param(param)
+        ),
+        key=lambda param: param.partition('=')[0]
+    ))
+    return urlunsplit((
+        parts.scheme.lower(),
+        userinfo + at + host.lower(),
+        parts.path,
+        query,
+        ''
+    ))
+
+
+def _write_page(save_path: Path, data: bytes) -> None:
+    """Saves downloaded page, meant to run in a worker thread"""
+    fd = os.open(save_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _write_pages(pages: list[DownloadedPage]) -> list[OSError | None]:
+    """Saves batch of pages, meant to run in a worker thread
+
+    Returns:
+        list[OSError | None]: error of each page, None if page is saved
+    """
+    errors: list[OSError | None] = []
+    for page in pages:
+        try:
+            _write_page(page.save_path, page.data)
+        except OSError as e:
+            errors.append(e)
+        else:
+            errors.append(None)
+    return errors
 
 
 class YCrawler:
     """Downloads fresh news from news.ycombinator.com with specified interval"""
     _BASE_URL = 'https://news.ycombinator.com'
+    _CHUNK_SIZE = 16384
+    _DUMP_WORKERS = 8
+    _DUMP_QUEUE_SIZE = 16
+    # Pages are written in small batches to save thread hops while memory
+    # held by a batch stays bounded
+    _WRITE_BATCH_PAGES = 8
+    _WRITE_BATCH_SIZE = 4 * 1024 * 1024
+    _RETRY_ATTEMPTS = 3
+    _RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+    _MAX_RETRY_DELAY = 60
+    _HN_CONCURRENCY = 4
+    _RELATED_MAX_CONCURRENCY = 100
+    # Politeness cap on connections to one host, limiters of HN and of
+    # each related host stay within it
+    _HOST_MAX_CONNECTIONS = 10
+    _RELATED_HOST_MAX_CONCURRENCY = _HOST_MAX_CONNECTIONS
+    _MAX_TRACKED_HOSTS = 1024
+    # Limiters bound requests below the pool size, so that requests do not
+    # queue for connections: HN ones, related ones and front page request
+    _POOL_SIZE = _HN_CONCURRENCY + _RELATED_MAX_CONCURRENCY + 1
 
     def __init__(self, save_path: Path, download_interval: int):
         self._save_path = save_path
         self._download_interval = download_interval
         self._running = False
-        self._current_news: list[NewsInfo] = []
-        self._timeout = aiohttp.ClientTimeout(total=10)
+        self._current_ids: frozenset[str] = frozenset()
+        self._timeout = aiohttp.ClientTimeout(
+            total=10,
+            sock_connect=5,
+            sock_read=5
+        )
+        self._ssl_context = ssl.create_default_context()
+        self._connector: aiohttp.TCPConnector | None = None
         self._yc_session: aiohttp.ClientSession | None = None
         self._related_session: aiohttp.ClientSession | None = None
-        self._downloaded_urls = 0
-        self._semaphore = asyncio.Semaphore(1)
+        # Related urls saved during crawler lifetime, failed ones are not
+        # added to be tried again by later news and ticks
+        self._seen_urls = ScalableBloomFilter(
+            initial_capacity=100_000,
+            error_rate=1e-4
+        )
+        # Related urls being downloaded now, to not download them twice
+        self._pending_urls: set[str] = set()
+        # Fingerprints of pages saved to disk to skip their near-duplicates
+        self._fingerprints: set[bytes] = set()
+        # HN answers 503 to frequent requests, capacity of other hosts is
+        # unknown and is found out on the fly for each host separately, so
+        # one slow host does not slow down downloads from the rest
+        self._hn_rate = HostRateLimiter(2)
+        self._hn_semaphore = asyncio.Semaphore(self._HN_CONCURRENCY)
+        self._related_limiter = HostConcurrencyLimiter(
+            max_concurrency=self._RELATED_MAX_CONCURRENCY,
+            max_hosts=self._MAX_TRACKED_HOSTS,
+            make_limiter=lambda: AdaptiveConcurrencyLimiter(
+                min_concurrency=1,
+                max_concurrency=self._RELATED_HOST_MAX_CONCURRENCY,
+                initial_concurrency=4,
+                is_overload=_is_overload
+            )
+        )
 
     def run_forever(self) -> None:
         """Runs crawler in asyncio event loop"""
@@ -40,22 +249,34 @@ class YCrawler:
     async def _run_forever_async(self):
         """Restarts downloads every `download_interval` seconds"""
         self._running = True
+        loop = asyncio.get_running_loop()
         for s in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
-            asyncio.get_running_loop().add_signal_handler(
-                s,
-                lambda: asyncio.create_task(self._shutdown())
-            )
-        active_downloads = []
-        while True:
-            active_downloads.append(asyncio.create_task(self._download_news()))
-            await asyncio.sleep(self._download_interval)
+            loop.add_signal_handler(s, self._shutdown)
+        # Sessions and connection pool shared by them live as long as
+        # crawler does to keep connections, DNS and TLS caches alive
+        self._connector = aiohttp.TCPConnector(
+            limit=self._POOL_SIZE,
+            limit_per_host=self._HOST_MAX_CONNECTIONS,
+            keepalive_timeout=60,
+            ttl_dns_cache=300,
+            ssl=self._ssl_context
+        )
+        self._yc_session = self._make_session(self._BASE_URL)
+        self._related_session = self._make_session()
+        async with self._connector, self._yc_session, self._related_session:
+            active_downloads: set[Task] = set()
+            while True:
+                download = asyncio.create_task(self._download_news())
+                active_downloads.add(download)
+                download.add_done_callback(active_downloads.discard)
+                await asyncio.sleep(self._download_interval)
 
-            active_downloads = [d for d in active_downloads if not d.done()]
-            if not self._running:
-                break
-        await asyncio.wait(active_downloads)
+                if not self._running:
+                    break
+            if active_downloads:
+                await asyncio.wait(active_downloads)
 
-    async def _shutdown(self):
+    def _shutdown(self) -> None:
         """Stops rerun of download"""
         logger.info('Gracefully shutdown: resolve all current downloads')
         self._running = False
@@ -64,160 +285,316 @@ class YCrawler:
         """Coro for downloading fresh news"""
         begin = time.time()
         logger.info('Checking for fresh news...')
-        self._prepare_sessions()
+        # Ticks may overlap, so each one counts its own stats
+        stats = TickStats()
         try:
             async with self._yc_session.get('/') as response:
-                page = await response.text()
+                latest_news = await self._get_latest_news(response)
         except asyncio.TimeoutError:
             logger.info('Unable to download news page: timeout error')
         except aiohttp.ClientResponseError as e:
             logger.info('Unable to download news page: %s', e)
+        except etree.XMLSyntaxError as e:
+            logger.info('Unable to parse news page: %s', e)
         else:
-            news_to_download = self._get_news_to_download(page)
+            news_to_download = self._filter_latest_news(latest_news)
             logger.info('Found %s fresh news', len(news_to_download))
             tasks = []
             for news_info in news_to_download:
                 tasks.append(asyncio.create_task(
-                    self._download_news_one(news_info)
+                    self._download_news_one(news_info, stats)
                 ))
             await asyncio.gather(*tasks, return_exceptions=True)
-            self._log_stats(news_to_download, tasks)
+            self._log_stats(len(news_to_download), stats)
         finally:
-            await self._finalize_sessions()
             logger.info('Done: %s sec', time.time() - begin)
 
-    def _prepare_sessions(self) -> None:
-        self._yc_session = aiohttp.ClientSession(
-            self._BASE_URL,
-            timeout=self._timeout,
-            raise_for_status=True
-        )
-        self._related_session = aiohttp.ClientSession(
+    def _make_session(
+        self,
+        base_url: str | None = None
+    ) -> aiohttp.ClientSession:
+        """Creates session on top of crawler connection pool"""
+        return aiohttp.ClientSession(
+            base_url,
+            connector=self._connector,
+            connector_owner=False,
             timeout=self._timeout,
             raise_for_status=True
         )
-        self._downloaded_urls = 0
 
-    async def _finalize_sessions(self):
-        await self._yc_session.close()
-        await self._related_session.close()
+    async def _iter_elements(
+        self,
+        response: aiohttp.ClientResponse,
+        tag: str
+    ) -> AsyncIterator[etree._Element]:
+        """Yields parsed `tag` elements while page is being downloaded
 
-    def _get_news_to_download(self, page: str) -> list[NewsInfo]:
-        soup = BeautifulSoup(page, 'html.parser')
-        latest_news = self._get_latest_news(soup)
-        news_to_download = self._filter_latest_news(latest_news)
-        return news_to_download
+        Element and everything before it is dropped once consumer is done
+        with it
+        """
+        parser = etree.HTMLPullParser(
+            events=('end',), tag=tag, encoding=response.charset
+        )
+        async for chunk in response.content.iter_chunked(self._CHUNK_SIZE):
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                yield element
+                _drop_parsed(element)
+        parser.close()
+        for _, element in parser.read_events():
+            yield element
+            _drop_parsed(element)
 
-    def _get_latest_news(self, soup: BeautifulSoup) -> list[NewsInfo]:
+    async def _get_latest_news(
+        self,
+        response: aiohttp.ClientResponse
+    ) -> list[NewsInfo]:
+        """Extracts news from front page rows as they are downloaded"""
         result = []
-        css_selector = 'td.title > span > a'
-        for news_row in soup.find_all('tr', class_='athing'):
-            news_id = news_row.attrs['id']
-            news_url = news_row.css.select_one(css_selector).attrs['href']
-            result.append(NewsInfo(news_id, news_url, set()))
+        async for news_row in self._iter_elements(response, 'tr'):
+            if 'athing' not in news_row.get('class', '').split():
+                continue
+            news_urls = _NEWS_URL_XPATH(news_row)
+            if news_urls:
+                result.append(NewsInfo(news_row.get('id'), news_urls[0]))
         return result
 
     def _filter_latest_news(
         self,
         latest_news: list[NewsInfo]
     ) -> list[NewsInfo]:
-        old_ids = set([n.id for n in self._current_news])
-        new_ids = set([n.id for n in latest_news])
-        ids_to_update = new_ids - old_ids
-        self._current_news = latest_news
+        new_ids = frozenset(n.id for n in latest_news)
+        ids_to_update = new_ids - self._current_ids
+        self._current_ids = new_ids
         return [n for n in latest_news if n.id in ids_to_update]
 
-    def _log_stats(
-        self,
-        news_to_download: list[NewsInfo],
-        download_results: list[Task]
-    ) -> None:
-        total_news = len(news_to_download)
-        downloaded_news = len([
-            n
-            for n in download_results
-            if n.exception() is None
-        ])
-        total_urls = sum(len(n.related_urls) for n in news_to_download)
+    def _log_stats(self, total_news: int, stats: TickStats) -> None:
         logger.info(
             'Downloaded %s out of %s news',
-            downloaded_news, total_news
+            stats.successful_news, total_news
         )
         logger.info(
             'Downloaded %s out of %s urls',
-            self._downloaded_urls, total_urls
+            stats.downloaded_urls, stats.found_urls
+        )
+        logger.info('Skipped %s already downloaded urls', stats.skipped_urls)
+        logger.info(
+            'Skipped %s urls being downloaded for other news',
+            stats.in_progress_urls
         )
 
-    async def _download_news_one(self, news_info: NewsInfo):
-        await self._get_related_urls(news_info)
+    async def _download_news_one(self, news_info: NewsInfo, stats: TickStats):
+        await self._get_related_urls(news_info, stats)
         logger.info(
             'Found %s related urls for %s/item?id=%s',
             len(news_info.related_urls), self._BASE_URL, news_info.id
         )
-        await self._dump_news(news_info)
+        await self._dump_news(news_info, stats)
+        stats.successful_news += 1
 
-    async def _get_related_urls(self, news_info: NewsInfo):
+    async def _get_related_urls(self, news_info: NewsInfo, stats: TickStats):
         error_msg_template = 'Unable to get news=%s comments: %s'
-        async with self._semaphore:
-            req_params = dict(params=dict(id=news_info.id))
-            try:
+        req_params = dict(params=dict(id=news_info.id))
+        await self._hn_rate.acquire()
+        try:
+            async with self._hn_semaphore:
                 async with self._yc_session.get('/item', **req_params) as resp:
-                    comments_page = await resp.text()
-            except asyncio.TimeoutError:
-                logger.debug(error_msg_template, news_info.id, 'timeout error')
-            except aiohttp.ClientResponseError as e:
-                logger.debug(error_msg_template, news_info.id, e)
-            except Exception as e:
-                logger.debug(error_msg_template, news_info.id, e)
-            else:
-                news_info.related_urls.update(
-                    self._find_related_urls_in_comments(comments_page)
-                )
-            finally:
-                # To avoid 503 error protecting from ddos
-                await asyncio.sleep(2)
+                    related_urls = await self._find_related_urls_in_comments(
+                        resp
+                    )
+        except asyncio.TimeoutError:
+            logger.debug(error_msg_template, news_info.id, 'timeout error')
+        except aiohttp.ClientResponseError as e:
+            logger.debug(error_msg_template, news_info.id, e)
+        except Exception as e:
+            logger.debug(error_msg_template, news_info.id, e)
+        else:
+            news_info.related_urls.update(related_urls)
+            stats.found_urls += len(related_urls)
 
-    def _find_related_urls_in_comments(self, comments_page: str) -> set[str]:
-        """Extracts urls from news comments"""
+    async def _find_related_urls_in_comments(
+        self,
+        response: aiohttp.ClientResponse
+    ) -> set[str]:
+        """Extracts urls from news comments as they are downloaded"""
         result = set()
-        soup = BeautifulSoup(comments_page, 'html.parser')
-        css_selector = 'div.comment > * a'
-        for link in soup.css.select(css_selector):
-            url = link.attrs['href']
-            if not url.startswith('reply?'):
-                result.add(url)
+        async for link in self._iter_elements(response, 'a'):
+            url = link.get('href')
+            if url and not url.startswith('reply?') and _IN_COMMENT_XPATH(link):
+                result.add(_normalize_url(url))
         return result
 
-    async def _dump_news(self, news_info: NewsInfo):
+    async def _dump_news(self, news_info: NewsInfo, stats: TickStats):
         logger.info('Dumping %s', news_info.id)
         news_path = self._save_path / f'{news_info.id}'
-        news_path.mkdir(parents=True, exist_ok=True)
-        tasks = []
-        for idx, url in enumerate(news_info.related_urls):
-            tasks.append(asyncio.create_task(
-                self._dump_url(url, news_path / f'url_{idx}.html', True)
-            ))
-        tasks.append(asyncio.create_task(
-            self._dump_url(news_info.url, news_path / 'page.html', False)
-        ))
-        await asyncio.gather(*tasks, return_exceptions=True)
-
-    async def _dump_url(self, url: str, save_path: Path, stat: bool):
         try:
-            if 'ycombinator' not in url:
-                async with self._related_session.get(url) as response:
-                    text = await response.text()
+            await asyncio.to_thread(
+                news_path.mkdir, parents=True, exist_ok=True
+            )
+        except OSError as e:
+            logger.error('Unable to create %s: %s', news_path, e)
+            raise
+        queue: asyncio.Queue[tuple[str, Path, bool]] = asyncio.Queue(
+            self._DUMP_QUEUE_SIZE
+        )
+        batch: list[DownloadedPage] = []
+        workers = [
+            asyncio.create_task(self._dump_worker(queue, batch, stats))
+            for _ in range(self._DUMP_WORKERS)
+        ]
+        try:
+            for idx, url in enumerate(news_info.related_urls):
+                if url in self._seen_urls:
+                    logger.debug('Already downloaded %s', url)
+                    stats.skipped_urls += 1
+                    continue
+                if url in self._pending_urls:
+                    logger.debug('Already being downloaded %s', url)
+                    stats.in_progress_urls += 1
+                    continue
+                self._pending_urls.add(url)
+                await queue.put((url, news_path / f'url_{idx}.html', True))
+            await queue.put((news_info.url, news_path / 'page.html', False))
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        if batch:
+            await self._save_pages(batch)
+
+    async def _dump_worker(
+        self,
+        queue: asyncio.Queue,
+        batch: list[DownloadedPage],
+        stats: TickStats
+    ):
+        """Dumps urls from queue until cancelled
+
+        Downloaded pages are collected to shared batch, which is written
+        once it is large enough
+        """
+        while True:
+            url, save_path, related = await queue.get()
+            try:
+                page = await self._dump_url(url, save_path, related, stats)
+            except Exception:
+                # Already logged, the rest of urls are still to be dumped
+                self._release_url(url, related, saved=False)
             else:
-                async with self._semaphore:
-                    async with self._yc_session.get(url) as response:
-                        text = await response.text()
-                        await asyncio.sleep(2)
+                if page is None:
+                    self._release_url(url, related, saved=True)
+                else:
+                    batch.append(page)
+                    if self._is_batch_full(batch):
+                        pages = batch.copy()
+                        batch.clear()
+                        await self._save_pages(pages)
+            finally:
+                queue.task_done()
+
+    def _is_batch_full(self, batch: list[DownloadedPage]) -> bool:
+        return (
+            len(batch) >= self._WRITE_BATCH_PAGES
+            or sum(len(page.data) for page in batch) >= self._WRITE_BATCH_SIZE
+        )
+
+    async def _save_pages(self, pages: list[DownloadedPage]):
+        """Writes batch of pages to disk in one worker thread call"""
+        errors = await asyncio.to_thread(_write_pages, pages)
+        for page, error in zip(pages, errors):
+            if error is None:
+                logger.debug('Downloaded %s', page.url)
+            else:
+                logger.error(
+                    'Unable to save %s to %s: %s',
+                    page.url, page.save_path, error
+                )
+                # Page is not on disk, its duplicates are still to be saved
+                self._fingerprints.discard(page.fingerprint)
+            self._release_url(page.url, page.related, saved=error is None)
+
+    def _release_url(self, url: str, related: bool, saved: bool) -> None:
+        """Unmarks url as pending, saved ones are not downloaded again"""
+        # News page is not marked as pending, it may still be marked by
+        # other news downloading it as related url
+        if not related:
+            return
+        if saved:
+            self._seen_urls.add(url)
+        self._pending_urls.discard(url)
+
+    async def _dump_url(
+        self,
+        url: str,
+        save_path: Path,
+        related: bool,
+        stats: TickStats
+    ) -> DownloadedPage | None:
+        """Downloads url and prepares page to be saved
+
+        Duplicates are dropped only among related urls, news page itself is
+        always saved to keep news directory complete
+
+        Returns:
+            DownloadedPage | None: page to save, None if page is duplicate
+        """
+        try:
+            data, content_type = await self._fetch_with_retry(url)
         except Exception as e:
             logger.debug('URL cannot be downloaded: %s, %s', e, url)
             raise e
         else:
-            async with aiofiles.open(save_path, 'w') as f:
-                await f.write(text)
-            if stat:
-                self._downloaded_urls += 1
-            logger.debug('Downloaded %s', url)
+            page = DownloadedPage(url, save_path, data, related)
+            if related:
+                stats.downloaded_urls += 1
+                page.fingerprint = self._fingerprint(data, content_type)
+                if page.fingerprint in self._fingerprints:
+                    logger.debug('Downloaded duplicate, not saved %s', url)
+                    return None
+                if page.fingerprint is not None:
+                    self._fingerprints.add(page.fingerprint)
+            return page
+
+    @staticmethod
+    def _fingerprint(data: bytes, content_type: str) -> bytes | None:
+        """Computes fingerprint of whole html page, None for other content"""
+        if content_type != 'text/html':
+            return None
+        return page_fingerprint(data)
+
+    async def _fetch_with_retry(self, url: str) -> tuple[bytes, str]:
+        """Downloads url retrying rate limits and server errors
+
+        Waits with jittered exponential backoff between attempts, but not
+        less than server asks in `Retry-After` header
+        """
+        for attempt in range(1, self._RETRY_ATTEMPTS + 1):
+            try:
+                return await self._fetch(url)
+            except aiohttp.ClientResponseError as e:
+                if (
+                    e.status not in self._RETRY_STATUSES
+                    or attempt == self._RETRY_ATTEMPTS
+                ):
+                    raise
+                retry_after = _parse_retry_after(
+                    e.headers.get('Retry-After') if e.headers else None
+                )
+                if retry_after > self._MAX_RETRY_DELAY:
+                    raise
+                backoff = min(self._MAX_RETRY_DELAY, 2 ** attempt)
+                delay = max(retry_after, backoff + random.uniform(0, 1))
+                logger.debug('Retry in %.1f sec after %s: %s', delay, e, url)
+                await asyncio.sleep(delay)
+
+    async def _fetch(self, url: str) -> tuple[bytes, str]:
+        """Downloads url, returns its content and content type"""
+        if 'ycombinator' not in url:
+            async with self._related_limiter.slot(urlsplit(url).netloc):
+                async with self._related_session.get(url) as response:
+                    return await response.read(), response.content_type
+        await self._hn_rate.acquire()
+        async with self._hn_semaphore:
+            async with self._yc_session.get(url) as response:
+                return await response.read(), response.content_type
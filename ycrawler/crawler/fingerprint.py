@@ -0,0 +1,21 @@
+import hashlib
+import re
+
+_TAG_RE = re.compile(rb'<(/?\w+)[^>]*>')
+_DIGITS = b'0123456789'
+
+
+def page_fingerprint(page: bytes) -> bytes:
+    """Computes digest of whole html page with its volatile parts stripped
+
+    Tag attributes and digits are dropped beforehand, so pages differing
+    only in counters, dates or generated attributes get the same fingerprint
+
+    Args:
+        page (bytes): html page content
+
+    Returns:
+        bytes: page fingerprint
+    """
+    stripped = _TAG_RE.sub(rb'<\1>', page.translate(None, _DIGITS))
+    return hashlib.blake2b(stripped, digest_size=16).digest()
@@ -1,17 +1,33 @@
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
 
 def init_logging(log_output: Path | None, verbose: bool) -> None:
     """Sets basic logging settings
 
+    Records are only put to queue by logging calls and are written out by
+    background thread, so event loop is not blocked on output
+
     Args:
         log_output (Path | None): path to log file. If is None, stdout is used
         verbose (bool): if True sets log level to DEBUG, INFO otherwise
     """
-    logging.basicConfig(
-        filename=log_output,
-        level=logging.DEBUG if verbose else logging.INFO,
-        format='[%(asctime)s] %(levelname).1s %(message)s',
+    if log_output is None:
+        output_handler = logging.StreamHandler()
+    else:
+        output_handler = logging.FileHandler(log_output)
+    output_handler.setFormatter(logging.Formatter(
+        fmt='[%(asctime)s] %(levelname).1s %(message)s',
         datefmt='%Y.%m.%d %H:%M:%S',
-    )
+    ))
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, output_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    root_logger.addHandler(QueueHandler(log_queue))
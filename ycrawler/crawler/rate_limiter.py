@@ -0,0 +1,160 @@
+import asyncio
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+
+
+class HostRateLimiter:
+    """Lets requests to a host through not more often than once per interval
+
+    Each caller reserves the next free time slot and sleeps until it comes,
+    so waiting does not hold any concurrency slot or connection
+    """
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        """Waits until request to the host is allowed"""
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limits number of concurrent calls adapting to server capacity
+
+    Works like TCP congestion control: limit grows by one per window of
+    successful calls and is halved once calls fail because server is
+    overloaded. Failures of calls started before the last decrease do not
+    decrease limit again
+
+    Args:
+        min_concurrency (int): lowest limit
+        max_concurrency (int): highest limit
+        initial_concurrency (int): limit to start with
+        is_overload (Callable[[Exception], bool]): tells if call error
+            means that server cannot cope with load
+    """
+
+    def __init__(
+        self,
+        min_concurrency: int,
+        max_concurrency: int,
+        initial_concurrency: int,
+        is_overload: Callable[[Exception], bool]
+    ):
+        self._min_concurrency = min_concurrency
+        self._max_concurrency = max_concurrency
+        self._limit = float(initial_concurrency)
+        self._is_overload = is_overload
+        self._active = 0
+        self._generation = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def idle(self) -> bool:
+        """Tells if no call holds or waits for a slot"""
+        return self._active == 0 and not self._waiters
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Holds one of concurrency slots while call is in progress"""
+        await self._acquire()
+        generation = self._generation
+        try:
+            yield
+        except Exception as e:
+            if self._is_overload(e) and generation == self._generation:
+                self._limit = max(self._min_concurrency, self._limit / 2)
+                self._generation += 1
+            raise
+        else:
+            self._limit = min(
+                self._max_concurrency,
+                self._limit + 1 / self._limit
+            )
+        finally:
+            self._active -= 1
+            self._wake_up()
+
+    async def _acquire(self) -> None:
+        while self._active >= int(self._limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if not waiter.cancelled():
+                    # Was woken up already, pass free slot to others
+                    self._wake_up()
+                raise
+        self._active += 1
+
+    def _wake_up(self) -> None:
+        free_slots = int(self._limit) - self._active
+        while free_slots > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+
+class HostConcurrencyLimiter:
+    """Adapts concurrency to every host separately under a global limit
+
+    Host slot is taken before the global one, so calls waiting for a slow
+    host do not hold global slots. Limiters of idle hosts are forgotten once
+    too many hosts are known
+
+    Args:
+        max_concurrency (int): limit of concurrent calls to all hosts
+        max_hosts (int): number of hosts to keep limiters for
+        make_limiter (Callable[[], AdaptiveConcurrencyLimiter]): creates
+            limiter for a new host
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_hosts: int,
+        make_limiter: Callable[[], AdaptiveConcurrencyLimiter]
+    ):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_hosts = max_hosts
+        self._make_limiter = make_limiter
+        self._limiters: OrderedDict[str, AdaptiveConcurrencyLimiter] = (
+            OrderedDict()
+        )
+
+    @asynccontextmanager
+    async def slot(self, host: str) -> AsyncIterator[None]:
+        """Holds slots of host and global one while call is in progress"""
+        async with self._get_limiter(host).slot():
+            async with self._semaphore:
+                yield
+
+    def _get_limiter(self, host: str) -> AdaptiveConcurrencyLimiter:
+        limiter = self._limiters.get(host)
+        if limiter is not None:
+            self._limiters.move_to_end(host)
+            return limiter
+        if len(self._limiters) >= self._max_hosts:
+            self._forget_idle_host()
+        limiter = self._limiters[host] = self._make_limiter()
+        return limiter
+
+    def _forget_idle_host(self) -> None:
+        idle_host = next(
+            (
+                host
+                for host, limiter in self._limiters.items()
+                if limiter.idle
+            ),
+            None
+        )
+        if idle_host is not None:
+            del self._limiters[idle_host]